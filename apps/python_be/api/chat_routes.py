@@ -1,24 +1,59 @@
 from typing import Optional, Any, Dict
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+import hashlib
 import json
 
 from services.chat_service import chat_search_auto
+from services.cache_utils import TTLLRUCache
+from services.embedding_cache import embedding_cache
+from services.semantic_cache import SemanticLRUCache
 
 chat_router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Exact-match response cache: repeat prompts (paging, refresh, re-asking the
+# same question) skip the whole embed + search + LLM round trip.
+_chat_cache = TTLLRUCache(maxsize=1024, ttl=300.0)
+
+# Semantic cache: near-duplicate prompts ("What is X?" vs "Please explain X")
+# reuse the response of the closest previously answered prompt.
+_semantic_cache = SemanticLRUCache(capacity=1024, max_distance=0.15)
+
 class ChatRequest(BaseModel):
     prompt: str
     k: Optional[int] = 5
 
+
+@chat_router.get("/cache/stats")
+async def cache_stats() -> Dict[str, Any]:
+    """Hit/miss statistics for the chat, semantic, and embedding caches."""
+    return {
+        "chat_cache": _chat_cache.stats(),
+        "semantic_cache": _semantic_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+    }
+
 @chat_router.post("/chat")
 async def chat_search(req: ChatRequest) -> Dict[str, Any]:
     """
     Accept a user prompt, invoke chat_search_auto (function-call auto mode),
     and return the assistant response plus any local search results.
+
+    Identical (prompt, k) requests within the cache TTL are served from an
+    in-process LRU cache without calling the model again.
     """
+    cache_key = hashlib.sha256(f"{req.k or 5}\0{req.prompt}".encode()).digest()
+    cached = _chat_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Fall back to the semantic cache for near-duplicate prompts
+    cached = await _semantic_cache.get(req.prompt, req.k or 5)
+    if cached is not None:
+        return cached
+
     try:
-        final_resp, search_results = chat_search_auto(req.prompt, req.k or 5)
+        final_resp, search_results = await chat_search_auto(req.prompt, req.k or 5)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -39,14 +74,18 @@ async def chat_search(req: ChatRequest) -> Dict[str, Any]:
     sources = []
     if search_results and "results" in search_results:
         sources = search_results["results"]
-    
-    print(f"[DEBUG CHAT] Found {len(sources)} sources from search_results")
-    if sources:
-        print(f"[DEBUG CHAT] First source: {sources[0].get('source', 'unknown')}")
 
-    return {
+    response = {
         "response": assistant_message or "No response generated",
         "sources": sources,
         "assistant_response": final_resp,
         "search_results": search_results,
-    }
\ No newline at end of file
+    }
+    # Only cache real answers: chat_search_auto returns an error dict on
+    # OpenAI failures, and caching that would replay a transient outage
+    # for the whole TTL (and indefinitely from the semantic cache)
+    failed = isinstance(final_resp, dict) and "error" in final_resp
+    if assistant_message and not failed:
+        _chat_cache.put(cache_key, response)
+        await _semantic_cache.put(req.prompt, req.k or 5, response)
+    return response
\ No newline at end of file
@@ -2,15 +2,59 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.responses import JSONResponse, FileResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import aiofiles
+import asyncio
+import operator
 import os
 import shutil
 import re
+import stat
 import unicodedata
 from pathlib import Path
-from services.index_service import IndexService
+from types import MappingProxyType
+from urllib.parse import quote
+from config import settings
+from services import index_jobs
 
 file_router = APIRouter()
-index_service = IndexService()
+
+# Bound concurrent upload writes so a burst of large files shares disk
+# bandwidth instead of thrashing it (configurable via MAX_CONCURRENT_UPLOADS).
+# Requests beyond a second bound are rejected rather than queued.
+_upload_semaphore = asyncio.Semaphore(settings.max_concurrent_uploads)
+_upload_waiters = 0
+
+# Debounce window before kicking off an index build after uploads, so a
+# burst of N uploads triggers one build instead of N. The pending set
+# carries the uploaded paths so the build indexes exactly those files
+# instead of re-scanning the whole document directory.
+_INDEX_DEBOUNCE_SECONDS = 5.0
+_pending_index_timer: Optional[asyncio.TimerHandle] = None
+_pending_upload_paths: set = set()
+
+
+def _debounced_enqueue() -> None:
+    """Timer callback: enqueue the build, retrying if one is still running."""
+    global _pending_index_timer
+    _pending_index_timer = None
+    if index_jobs.enqueue_build(files=sorted(_pending_upload_paths)) is None:
+        # A build is already in progress; try again after another window
+        _pending_index_timer = asyncio.get_running_loop().call_later(
+            _INDEX_DEBOUNCE_SECONDS, _debounced_enqueue
+        )
+    else:
+        _pending_upload_paths.clear()
+
+
+def _schedule_index_build(file_path: Path) -> None:
+    """(Re)start the debounce timer; the build runs once uploads go quiet."""
+    global _pending_index_timer
+    _pending_upload_paths.add(str(file_path))
+    if _pending_index_timer is not None:
+        _pending_index_timer.cancel()
+    _pending_index_timer = asyncio.get_running_loop().call_later(
+        _INDEX_DEBOUNCE_SECONDS, _debounced_enqueue
+    )
 
 # Document source directory
 DOCUMENT_SOURCE_DIR = Path(__file__).parent.parent / "document_source"
@@ -22,6 +66,19 @@ DOCUMENT_SOURCE_DIR.mkdir(exist_ok=True)
 ALLOWED_EXTENSIONS = {".pdf", ".txt", ".docx", ".doc"}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 
+# Extension -> Content-Type map for downloads (read-only, built once)
+MEDIA_TYPES = MappingProxyType({
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".doc": "application/msword",
+})
+
+# Precompiled patterns for sanitize_filename (compiled once, not per upload)
+_RE_SEPARATORS = re.compile(r'[\s\-]+')
+_RE_NON_WORD = re.compile(r'[^\w]')
+_RE_MULTI_UNDERSCORE = re.compile(r'_+')
+
 
 def sanitize_filename(filename: str) -> str:
     """
@@ -40,13 +97,13 @@ def sanitize_filename(filename: str) -> str:
     name = name.encode('ascii', 'ignore').decode('ascii')
     
     # Replace spaces and common separators with underscores
-    name = re.sub(r'[\s\-]+', '_', name)
-    
+    name = _RE_SEPARATORS.sub('_', name)
+
     # Remove any character that is not alphanumeric or underscore
-    name = re.sub(r'[^\w]', '', name)
-    
+    name = _RE_NON_WORD.sub('', name)
+
     # Remove multiple consecutive underscores
-    name = re.sub(r'_+', '_', name)
+    name = _RE_MULTI_UNDERSCORE.sub('_', name)
     
     # Remove leading/trailing underscores
     name = name.strip('_')
@@ -58,6 +115,50 @@ def sanitize_filename(filename: str) -> str:
     return f"{name}{extension.lower()}"
 
 
+def _copy_spooled_upload(src_file, dest_path: Path) -> int:
+    """
+    Copy an upload that has already been spooled to disk into dest_path.
+
+    Runs synchronously (call via asyncio.to_thread). Uses os.sendfile on
+    Linux so the bytes move kernel-side without user-space copies, falling
+    back to a buffered shutil.copyfileobj on other platforms.
+    Returns the number of bytes written.
+    Raises ValueError if the file exceeds MAX_FILE_SIZE.
+    """
+    src_file.seek(0, os.SEEK_END)
+    total_size = src_file.tell()
+    if total_size > MAX_FILE_SIZE:
+        raise ValueError(
+            f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+    src_file.seek(0)
+
+    with open(dest_path, "wb") as out:
+        try:
+            src_fd = src_file.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd = None
+
+        if src_fd is not None and hasattr(os, "sendfile"):
+            # Zero-copy path: file -> file entirely in kernel space
+            offset = 0
+            while offset < total_size:
+                sent = os.sendfile(out.fileno(), src_fd, offset, 1 << 20)
+                if sent == 0:
+                    break
+                offset += sent
+            if offset == total_size:
+                return total_size
+            # Partial sendfile (e.g. unsupported filesystem); redo buffered
+            out.seek(0)
+            out.truncate()
+            src_file.seek(0)
+
+        shutil.copyfileobj(src_file, out, length=1 << 20)
+
+    return total_size
+
+
 class FileInfo(BaseModel):
     filename: str = Field(..., description="Name of the file")
     filepath: str = Field(..., description="Download URL path for the file")
@@ -124,7 +225,7 @@ class UploadResponse(BaseModel):
     size: int = Field(..., description="File size in bytes")
     indexing_started: Optional[bool] = Field(
         default=None,
-        description="Whether background indexing was started after upload",
+        description="Whether a background index build was scheduled after upload",
     )
     
     model_config = {
@@ -141,6 +242,11 @@ class UploadResponse(BaseModel):
     }
 
 
+# Cached directory listing, invalidated when the directory mtime changes
+_files_cache: Optional[FileListResponse] = None
+_files_cache_mtime_ns: int = -1
+
+
 @file_router.get(
     "/files",
     response_model=FileListResponse,
@@ -156,36 +262,47 @@ class UploadResponse(BaseModel):
 async def list_files():
     """
     List all files in the document_source directory.
-    
+
     Returns information about each file including:
     - Filename
     - Relative filepath
     - File size in bytes
     - File extension
+
+    The listing is cached and only rebuilt when the directory's mtime
+    changes (i.e. files were added or removed), so UI polling hits memory
+    rather than the filesystem.
     """
+    global _files_cache, _files_cache_mtime_ns
     try:
-        files_info = []
-        
-        # Iterate through all files in the document_source directory
-        for file_path in DOCUMENT_SOURCE_DIR.iterdir():
-            if file_path.is_file():
-                file_size = file_path.stat().st_size
-                download_path = f"/api/v1/files/download/{file_path.name}"
-                
-                files_info.append(FileInfo(
-                    filename=file_path.name,
-                    filepath=download_path,
-                    size=file_size,
-                    extension=file_path.suffix
-                ))
-        
+        dir_mtime_ns = DOCUMENT_SOURCE_DIR.stat().st_mtime_ns
+        if _files_cache is not None and dir_mtime_ns == _files_cache_mtime_ns:
+            return _files_cache
+
+        # os.scandir reuses the stat info from the directory read, avoiding
+        # an extra stat() syscall and Path allocation per entry
+        with os.scandir(DOCUMENT_SOURCE_DIR) as entries:
+            files_info = [
+                FileInfo(
+                    filename=entry.name,
+                    filepath=f"/api/v1/files/download/{entry.name}",
+                    size=entry.stat().st_size,
+                    extension=os.path.splitext(entry.name)[1],
+                )
+                for entry in entries
+                if entry.is_file(follow_symlinks=False)
+            ]
+
         # Sort by filename
-        files_info.sort(key=lambda x: x.filename)
-        
-        return FileListResponse(
+        files_info.sort(key=operator.attrgetter("filename"))
+
+        response = FileListResponse(
             files=files_info,
             total_files=len(files_info)
         )
+        _files_cache = response
+        _files_cache_mtime_ns = dir_mtime_ns
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
 
@@ -248,38 +365,67 @@ async def upload_file(
                 file_path = DOCUMENT_SOURCE_DIR / safe_filename
                 counter += 1
         
-        # Stream upload to file
+        # Reject outright once too many uploads are in flight or queued, so
+        # sustained overload fails fast instead of building an unbounded
+        # await queue. The threshold sits above the semaphore size so short
+        # bursts wait their turn instead of being bounced.
+        global _upload_waiters
+        if _upload_waiters >= settings.max_queued_uploads:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent uploads. Please try again shortly."
+            )
+
+        # Stream upload to file (async writes keep the event loop free for other requests)
         total_size = 0
+        _upload_waiters += 1
         try:
-            with open(file_path, "wb") as f:
-                while chunk := await file.read(1024 * 1024):  # Read 1MB chunks
-                    total_size += len(chunk)
-                    
-                    # Check file size limit
-                    if total_size > MAX_FILE_SIZE:
-                        # Delete the partially uploaded file
-                        if file_path.exists():
-                            file_path.unlink()
-                        raise HTTPException(
-                            status_code=413,
-                            detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // (1024*1024)}MB"
-                        )
-                    
-                    f.write(chunk)
-        except HTTPException:
-            raise
-        except Exception as e:
-            # Clean up on error
-            if file_path.exists():
-                file_path.unlink()
-            raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+            async with _upload_semaphore:
+                try:
+                    if getattr(file.file, "_rolled", False):
+                        # Large uploads are already spooled to a temp file by starlette;
+                        # copy them file-to-file on a worker thread (sendfile on Linux)
+                        # instead of pumping 1MB chunks through the event loop.
+                        try:
+                            total_size = await asyncio.to_thread(
+                                _copy_spooled_upload, file.file, file_path
+                            )
+                        except ValueError as e:
+                            raise HTTPException(status_code=413, detail=str(e))
+                    else:
+                        async with aiofiles.open(file_path, "wb") as f:
+                            while chunk := await file.read(1024 * 1024):  # Read 1MB chunks
+                                total_size += len(chunk)
+
+                                # Check file size limit
+                                if total_size > MAX_FILE_SIZE:
+                                    raise HTTPException(
+                                        status_code=413,
+                                        detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // (1024*1024)}MB"
+                                    )
+
+                                await f.write(chunk)
+                except HTTPException:
+                    # Delete the partially uploaded file without blocking the event loop
+                    if file_path.exists():
+                        await asyncio.to_thread(file_path.unlink)
+                    raise
+                except Exception as e:
+                    # Clean up on error
+                    if file_path.exists():
+                        await asyncio.to_thread(file_path.unlink)
+                    raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+        finally:
+            _upload_waiters -= 1
         
         # Get download path for response
         download_path = f"/api/v1/files/download/{safe_filename}"
 
-        # Always rebuild embeddings to include the new file in the search index
-        index_result = index_service.build_index()
-        indexing_started = index_result.get("success", False)
+        # Schedule a debounced index build for the uploaded file; uploads
+        # arriving within the debounce window share one build, and only the
+        # new files are chunked and embedded (no full directory re-scan).
+        _schedule_index_build(file_path)
+        indexing_started = True
         
         return UploadResponse(
             message="File uploaded successfully",
@@ -371,39 +517,42 @@ async def download_file(filename: str):
         # Create safe filename (prevent directory traversal)
         safe_filename = Path(filename).name
         file_path = DOCUMENT_SOURCE_DIR / safe_filename
-        
-        # Check if file exists
-        if not file_path.exists() or not file_path.is_file():
+
+        # Single stat() for both the existence check and the response
+        # (passing stat_result lets starlette skip its own stat and set
+        # Content-Length up front for HTTP range requests)
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
             raise HTTPException(
                 status_code=404,
                 detail=f"File '{safe_filename}' not found"
             )
-        
+
         # Determine media type based on extension
-        media_types = {
-            ".pdf": "application/pdf",
-            ".txt": "text/plain",
-            ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            ".doc": "application/msword",
-        }
-        
-        file_extension = file_path.suffix.lower()
-        media_type = media_types.get(file_extension, "application/octet-stream")
-        
-        # URL-encode the filename for the Content-Disposition header to handle special characters
-        from urllib.parse import quote
-        encoded_filename = quote(safe_filename)
-        
+        file_extension = os.path.splitext(safe_filename)[1].lower()
+        media_type = MEDIA_TYPES.get(file_extension, "application/octet-stream")
+
+        # Only URL-encode the Content-Disposition filename when it actually
+        # contains non-ASCII characters (rare after sanitize_filename)
+        if safe_filename.isascii():
+            disposition = f'attachment; filename="{safe_filename}"'
+        else:
+            disposition = f"attachment; filename*=UTF-8''{quote(safe_filename)}"
+
         # Return file as response
         return FileResponse(
             path=str(file_path),
             media_type=media_type,
             filename=safe_filename,
+            stat_result=stat_result,
             headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
+                "Content-Disposition": disposition
             }
         )
-        
+
     except HTTPException:
         raise
     except Exception as e:
@@ -437,25 +586,30 @@ async def view_pdf(filename: str):
         # Create safe filename (prevent directory traversal)
         safe_filename = Path(filename).name
         file_path = DOCUMENT_SOURCE_DIR / safe_filename
-        
-        # Check if file exists
-        if not file_path.exists() or not file_path.is_file():
+
+        # Single stat() for both the existence check and the response
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
             raise HTTPException(
                 status_code=404,
                 detail=f"File '{safe_filename}' not found"
             )
-        
+
         # Check if it's a PDF
         if not safe_filename.lower().endswith('.pdf'):
             raise HTTPException(
                 status_code=400,
                 detail="Only PDF files can be viewed with this endpoint"
             )
-        
+
         # Return PDF file with inline display and CORS headers
         return FileResponse(
             path=str(file_path),
             media_type="application/pdf",
+            stat_result=stat_result,
             headers={
                 "Content-Disposition": f'inline; filename="{safe_filename}"',
                 "Access-Control-Allow-Origin": "*",
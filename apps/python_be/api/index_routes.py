@@ -1,17 +1,20 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import asyncio
+from dataclasses import dataclass, field
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from services.index_service import IndexService
+from services import index_jobs
 
 index_router = APIRouter()
-index_service = IndexService()
 
-# Track indexing status (in production, use a proper job queue like Celery or Redis)
-indexing_status = {
-    "is_running": False,
-    "last_result": None,
-    "progress": None
-}
+
+@dataclass
+class IndexState:
+    """Serializes the 409-check and enqueue across concurrent requests."""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+_index_state = IndexState()
 
 
 class FileProcessed(BaseModel):
@@ -75,28 +78,6 @@ class IndexStatusResponse(BaseModel):
     }
 
 
-def run_index_build(rebuild: bool = False):
-    """Background task to build the index."""
-    global indexing_status
-    
-    try:
-        indexing_status["is_running"] = True
-        indexing_status["progress"] = "Starting indexing process..."
-        
-        result = index_service.build_index(rebuild=rebuild)
-        
-        indexing_status["last_result"] = result
-        indexing_status["is_running"] = False
-        indexing_status["progress"] = None
-    except Exception as e:
-        indexing_status["last_result"] = {
-            "success": False,
-            "error": f"Unexpected error during indexing: {str(e)}"
-        }
-        indexing_status["is_running"] = False
-        indexing_status["progress"] = None
-
-
 @index_router.post(
     "/index/build",
     response_model=BuildIndexResponse,
@@ -124,32 +105,29 @@ def run_index_build(rebuild: bool = False):
         500: {"description": "Error during indexing"},
     },
 )
-async def build_index(background_tasks: BackgroundTasks, rebuild: bool = False):
+async def build_index(rebuild: bool = False):
     """
     Build the search index from all PDF files in document_source.
-    
+
     **Parameters:**
     - `rebuild`: If true, clears all existing data and rebuilds from scratch.
                 If false (default), only indexes new files (incremental).
-    
+
     This endpoint will process PDFs, extract text, create embeddings,
     and store them in ChromaDB for semantic search.
-    
-    The operation runs in the background and returns immediately. Use the
-    `/index/status` endpoint to check the progress and results.
+
+    The build runs in a separate worker process and this endpoint returns
+    immediately. Use the `/index/status` endpoint to check the progress
+    and results.
     """
-    global indexing_status
-    
-    # Check if indexing is already running
-    if indexing_status["is_running"]:
-        raise HTTPException(
-            status_code=409,
-            detail="Indexing is already in progress. Please wait for it to complete."
-        )
-    
-    # Start indexing in background
-    background_tasks.add_task(run_index_build, rebuild=rebuild)
-    
+    # Submit to the job queue (returns None if a build is already running)
+    async with _index_state.lock:
+        if index_jobs.enqueue_build(rebuild=rebuild) is None:
+            raise HTTPException(
+                status_code=409,
+                detail="Indexing is already in progress. Please wait for it to complete."
+            )
+
     mode = "full rebuild" if rebuild else "incremental"
     return BuildIndexResponse(
         success=True,
@@ -193,24 +171,20 @@ async def build_index_sync(rebuild: bool = False):
     This endpoint processes all PDFs and returns the result immediately.
     It may take several minutes to complete for large document sets.
     """
-    global indexing_status
-    
-    # Check if indexing is already running
-    if indexing_status["is_running"]:
+    # Submit to the job queue (returns None if a build is already running)
+    async with _index_state.lock:
+        job = index_jobs.enqueue_build(rebuild=rebuild)
+    if job is None:
         raise HTTPException(
             status_code=409,
             detail="Indexing is already in progress. Please wait for it to complete."
         )
-    
+
     try:
-        indexing_status["is_running"] = True
-        result = index_service.build_index(rebuild=rebuild)
-        indexing_status["last_result"] = result
-        indexing_status["is_running"] = False
-        
+        # Wait for the worker process without blocking the event loop
+        result = await asyncio.wrap_future(job)
         return BuildIndexResponse(**result)
     except Exception as e:
-        indexing_status["is_running"] = False
         raise HTTPException(
             status_code=500,
             detail=f"Error during indexing: {str(e)}"
@@ -237,8 +211,4 @@ async def get_index_status():
     - Result of the last indexing operation (if any)
     - Current progress message (if running)
     """
-    return IndexStatusResponse(
-        is_running=indexing_status["is_running"],
-        last_result=indexing_status["last_result"],
-        progress=indexing_status["progress"]
-    )
+    return IndexStatusResponse(**index_jobs.get_status())
@@ -4,12 +4,18 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false" # Avoid huggingface complaint
 import glob
+import hashlib
 import pymupdf
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict
 
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 import chromadb
 
+from services import doc_codec
+
 # --------- Config ---------
 DOCUMENT_DIR = "./document_source"           # folder containing your PDFs
 CHROMA_DIR = "./chroma_stm32"               # Chroma persistent directory
@@ -20,6 +26,40 @@ EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 MAX_CHARS = 1500
 OVERLAP = 200
 
+# Sidecar file with int8-quantized embeddings (4x smaller than float32),
+# used by search_index for low-memory exact search with rerank
+INT8_SIDECAR = os.path.join(CHROMA_DIR, "embeddings_int8.npz")
+
+
+def make_chroma_client():
+    """
+    Open a Chroma client. When CHROMA_HTTP_HOST is set, talk to a
+    `chroma run` sidecar over HTTP so SQLite writes happen out of process
+    and can overlap with our own work; otherwise fall back to the
+    embedded PersistentClient.
+    """
+    host = os.getenv("CHROMA_HTTP_HOST")
+    if host:
+        return chromadb.HttpClient(
+            host=host, port=int(os.getenv("CHROMA_HTTP_PORT", "8000"))
+        )
+    return chromadb.PersistentClient(path=CHROMA_DIR)
+
+
+def quantize_int8(embeddings: np.ndarray) -> tuple:
+    """
+    Scalar-quantize embeddings to int8 with per-dimension calibration.
+
+    Returns (int8_matrix, lo, scale) where the original values are
+    approximately (int8 + 128) * scale + lo.
+    """
+    lo = embeddings.min(axis=0)
+    hi = embeddings.max(axis=0)
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1.0  # constant dimensions
+    quantized = np.round((embeddings - lo) / scale - 128.0)
+    return quantized.clip(-128, 127).astype(np.int8), lo, scale
+
 
 def load_and_chunk_pdf(pdf_path: str,
                        max_chars: int = MAX_CHARS,
@@ -27,40 +67,69 @@ def load_and_chunk_pdf(pdf_path: str,
     """
     Load a PDF and split each page into overlapping text chunks.
     Returns a list of dicts: {page, text, source}
+
+    Pages are streamed: each page's text is chunked as soon as it is
+    extracted and then dropped, so peak memory stays constant in the page
+    count instead of holding the whole document's text at once.
     """
     doc = pymupdf.open(pdf_path)
-    pages = []
-    for i, page in enumerate(doc):
-        text = page.get_text("text")
-        pages.append({"page": i + 1, "text": text})
 
     def split_into_chunks(text: str,
                           max_chars: int = max_chars,
                           overlap: int = overlap) -> List[str]:
-        paras = [p.strip() for p in text.split("\n") if p.strip()]
-        chunks, current = [], ""
-        for p in paras:
-            if len(current) + len(p) + 1 > max_chars:
-                chunks.append(current)
-                # keep some tail as overlap
-                current = current[-overlap:] + "\n" + p
+        # Build chunks in a list-of-strings buffer with a running length
+        # counter; repeated `current += p` reallocates the whole string
+        # every iteration, which is quadratic on long pages
+        chunks: List[str] = []
+        buf: List[str] = []
+        buf_len = 0
+        for p in text.split("\n"):
+            p = p.strip()
+            if not p:
+                continue
+            if buf_len + len(p) + 1 > max_chars:
+                chunk = "".join(buf)
+                chunks.append(chunk)
+                # keep some tail as overlap, dropping the leading partial
+                # word so the next chunk doesn't start mid-token (torn
+                # fragments embed poorly and hurt recall)
+                tail = chunk[-overlap:]
+                tail = tail[tail.find(" ") + 1:]
+                buf = [tail, "\n", p]
+                buf_len = len(tail) + 1 + len(p)
+            elif buf:
+                buf.append("\n")
+                buf.append(p)
+                buf_len += len(p) + 1
             else:
-                current += "\n" + p if current else p
-        if current:
-            chunks.append(current)
+                buf = [p]
+                buf_len = len(p)
+        if buf:
+            chunks.append("".join(buf))
         return chunks
 
     all_chunks = []
     src_name = os.path.basename(pdf_path)
-    for page in pages:
-        for chunk in split_into_chunks(page["text"]):
+    page_count = 0
+    for i, page in enumerate(doc):
+        page_count += 1
+        # Layout blocks instead of raw text order: the STM reference
+        # manuals are multi-column, and "text" mode interleaves the
+        # columns into noisy chunks. Sort text blocks column-first
+        # (bucketed by x0 at half page width), top to bottom within a
+        # column, so each chunk reads as contiguous prose.
+        page_width = page.rect.width or 1.0
+        blocks = [b for b in page.get_text("blocks") if b[6] == 0]
+        blocks.sort(key=lambda b: (round(b[0] / (page_width / 2)), b[1]))
+        page_text = "\n".join(b[4] for b in blocks)
+        for chunk in split_into_chunks(page_text):
             all_chunks.append({
-                "page": page["page"],
+                "page": i + 1,
                 "text": chunk,
                 "source": src_name,  # use filename as source
             })
 
-    print(f"[{src_name}] Pages: {len(pages)}, Chunks: {len(all_chunks)}")
+    print(f"[{src_name}] Pages: {page_count}, Chunks: {len(all_chunks)}")
     return all_chunks
 
 
@@ -78,21 +147,39 @@ def main():
         )
 
     all_texts: List[str] = []
-    all_metadatas: List[Dict] = []
     all_ids: List[str] = []
 
-    chunk_idx = 0
-    for pdf_path in pdf_files:
-        chunks = load_and_chunk_pdf(pdf_path)
+    # SoA layout for chunk metadata: three parallel arrays instead of a
+    # dict per chunk (a dict costs ~240B of PyObject overhead for ~20B of
+    # data); the dicts Chroma expects are materialized lazily per upsert
+    # batch. Source/file_path entries reference one shared string per file.
+    chunk_pages: List[int] = []
+    chunk_sources: List[str] = []
+    chunk_file_paths: List[str] = []
+
+    # Text extraction is CPU-bound and independent per file: run one
+    # worker process per PDF (map preserves input order, so chunk ids
+    # stay deterministic)
+    with ProcessPoolExecutor(max_workers=min(len(pdf_files), os.cpu_count() or 1)) as pool:
+        chunk_lists = list(pool.map(load_and_chunk_pdf, pdf_files))
+
+    # Stable ids hashed from (source, page, ordinal): re-running the build
+    # upserts the same rows instead of needing a wipe-and-recount pass
+    chunk_ordinals: Dict[tuple, int] = {}
+    for pdf_path, chunks in zip(pdf_files, chunk_lists):
+        src_name = os.path.basename(pdf_path)
         for c in chunks:
             all_texts.append(c["text"])
-            all_metadatas.append({
-                "page": c["page"],
-                "source": c["source"],
-                "file_path": pdf_path,
-            })
-            all_ids.append(f"chunk_{chunk_idx}")
-            chunk_idx += 1
+            chunk_pages.append(c["page"])
+            chunk_sources.append(src_name)
+            chunk_file_paths.append(pdf_path)
+            key = (src_name, c["page"])
+            ordinal = chunk_ordinals.get(key, 0)
+            chunk_ordinals[key] = ordinal + 1
+            all_ids.append(hashlib.blake2b(
+                f"{src_name}:{c['page']}:{ordinal}".encode(),
+                digest_size=8
+            ).hexdigest())
 
     print("Total chunks collected:", len(all_texts))
     if not all_texts:
@@ -101,43 +188,112 @@ def main():
 
     # ----- 2) Load embedding model -----
     print(f"Loading embedding model: {EMBEDDING_MODEL_NAME} ...")
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+        # FP16 halves memory traffic on GPU with negligible quality loss
+        model.half()
+    else:
+        torch.set_num_threads(os.cpu_count() or 1)
+        try:
+            # ONNX Runtime executes the transformer with graph-optimized
+            # kernels (AVX-512/VNNI where the CPU supports them), several
+            # times faster than eager PyTorch for CPU inference
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+        except Exception:
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-    print("Encoding document chunks...")
-    # For this model we just use `.encode` for documents
-    doc_embeddings = model.encode(
-        all_texts,
+    print(f"Encoding document chunks on {device}...")
+    # Sort by length so each mini-batch holds similarly sized texts
+    # (minimizes padding waste), then scatter back to the original order
+    order = sorted(range(len(all_texts)), key=lambda i: len(all_texts[i]))
+    sorted_texts = [all_texts[i] for i in order]
+    sorted_embeddings = model.encode(
+        sorted_texts,
+        batch_size=256,
         convert_to_numpy=True,
+        normalize_embeddings=True,
         show_progress_bar=True
     )
-    # Ensure float32 for Chroma
-    doc_embeddings = doc_embeddings.astype("float32")
+    # Round-trip through float16 before the float32 Chroma stores on the
+    # wire: normalized MiniLM vectors tolerate half precision with
+    # negligible cosine error, and rows written this way compress to half
+    # the bytes wherever a scalar-quant segment is available downstream
+    doc_embeddings = np.empty(sorted_embeddings.shape, dtype="float32")
+    doc_embeddings[order] = sorted_embeddings.astype(np.float16).astype("float32")
 
     print("Embeddings shape:", doc_embeddings.shape)
 
+    # ----- 2b) Persist an int8-quantized sidecar -----
+    # Chroma stores float32 regardless of the input dtype, so quantizing
+    # inside the collection would save nothing; the sidecar keeps a 4x
+    # smaller copy that search_index can scan with oversampling and then
+    # rerank against the full-precision query.
+    int8_embeddings, int8_lo, int8_scale = quantize_int8(doc_embeddings)
+    np.savez_compressed(
+        INT8_SIDECAR,
+        ids=np.array(all_ids),
+        embeddings=int8_embeddings,
+        lo=int8_lo,
+        scale=int8_scale,
+    )
+    print(f"Saved int8 sidecar: {INT8_SIDECAR}")
+
     # ----- 3) Create Chroma collection and store embeddings -----
-    client = chromadb.PersistentClient(path=CHROMA_DIR)
+    client = make_chroma_client()
     collection = client.get_or_create_collection(
         name=COLLECTION_NAME,
         embedding_function=None,  # we provide precomputed embeddings
+        # Vectors are unit-normalized: inner product ranks identically to
+        # cosine while HNSW skips the per-candidate norm
+        metadata={"hnsw:space": "ip"},
     )
 
-    # Optional: clear old data if re-indexing
-    if collection.count() > 0:
-        existing = collection.get()
-        existing_ids = existing.get("ids", [])
-        if existing_ids:
-            print(f"Clearing old data from collection '{COLLECTION_NAME}' "
-                  f"({len(existing_ids)} items)...")
-            collection.delete(ids=existing_ids)
-
-    print("Adding chunks to Chroma...")
-    collection.add(
-        ids=all_ids,
-        documents=all_texts,
-        metadatas=all_metadatas,
-        embeddings=doc_embeddings.tolist(),
-    )
+    print("Upserting chunks to Chroma...")
+    # Upsert with the stable ids: unchanged chunks are overwritten in
+    # place and no get-all-ids/delete pass is needed. Numpy slices go to
+    # Chroma directly (no float boxing) in batches so no monolithic
+    # payload is re-pickled internally. Batches are submitted to a small
+    # thread pool so writes overlap — against a chroma-server sidecar this
+    # pipelines serialization, network, and the server's SQLite commits
+    # instead of paying them sequentially. Note: chunks from files that
+    # were deleted since the last run are not removed; drop the
+    # collection for a truly clean rebuild.
+    ADD_BATCH = 5000
+
+    # With zstandard installed, the documents column holds each chunk
+    # base64 zstd-compressed (flagged per row in metadata, which stays
+    # small); search paths decompress only the top-k hits they return
+    compress = doc_codec.compression_available()
+
+    def make_metadata(idx: int) -> Dict:
+        meta = {
+            "page": chunk_pages[idx],
+            "source": chunk_sources[idx],
+            "file_path": chunk_file_paths[idx],
+        }
+        if compress:
+            meta[doc_codec.ZDOC_KEY] = True
+        return meta
+
+    def upsert_batch(start: int):
+        end = min(start + ADD_BATCH, len(all_ids))
+        docs = all_texts[start:end]
+        if compress:
+            docs = [doc_codec.compress_document(t) for t in docs]
+        collection.upsert(
+            ids=all_ids[start:end],
+            documents=docs,
+            metadatas=[make_metadata(i) for i in range(start, end)],
+            embeddings=doc_embeddings[start:end],
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as writers:
+        for future in [
+            writers.submit(upsert_batch, start)
+            for start in range(0, len(all_ids), ADD_BATCH)
+        ]:
+            future.result()
 
     print("Done.")
     print("Chroma collection size:", collection.count())
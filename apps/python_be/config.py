@@ -18,6 +18,12 @@ class Settings(BaseSettings):
     # Embedding Model Settings
     embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
     
+    # Upload Settings
+    max_concurrent_uploads: int = 4
+    # Uploads beyond the concurrency bound queue on the semaphore up to
+    # this total; anything past it is rejected with 503
+    max_queued_uploads: int = 16
+
     # CORS Settings
     cors_origins: List[str] = ["*"]
     
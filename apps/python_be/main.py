@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from pathlib import Path
 from api.routes import search_router
 from api.file_routes import file_router
@@ -33,6 +33,9 @@ app = FastAPI(
     6. Chat with the model to ask for information about the documents using `/api/v1/chat/chat` endpoint
     """,
     version="1.0.0",
+    # orjson serializes large payloads (chat sources, search results)
+    # several times faster than stdlib json
+    default_response_class=ORJSONResponse,
     contact={
         "name": "API Support",
         "url": "https://github.com/huynhducmink/Class13AIChatBotEmbedded",
@@ -1,40 +1,139 @@
 # search_index.py
 # Search in ChromaDB with SAMPLE_QUERY input
 
+import os
+
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from services import doc_codec
+
 SAMPLE_QUERY="Low-power mode wakeup timings"
 
 CHROMA_DIR = "./chroma_stm32"
 COLLECTION_NAME = "stm32_manual_embedding"
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+# int8-quantized sidecar written by build_index (4x smaller than float32)
+INT8_SIDECAR = os.path.join(CHROMA_DIR, "embeddings_int8.npz")
+
+_int8_index = None  # lazily loaded sidecar contents
+
+# Module-level singletons: loading the model (~2s) and opening the Chroma
+# client per call would otherwise dominate every query's latency
+_model = None
+_client = None
+_collection = None
+
+
+def _make_model() -> SentenceTransformer:
+    """Build the query encoder, preferring the ONNX backend on CPU."""
+    try:
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+    except Exception:
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def _get_model() -> SentenceTransformer:
+    global _model
+    if _model is None:
+        _model = _make_model()
+    return _model
+
+
+def _make_client():
+    """HttpClient against a chroma-server sidecar when CHROMA_HTTP_HOST
+    is set, embedded PersistentClient otherwise."""
+    host = os.getenv("CHROMA_HTTP_HOST")
+    if host:
+        return chromadb.HttpClient(
+            host=host, port=int(os.getenv("CHROMA_HTTP_PORT", "8000"))
+        )
+    return chromadb.PersistentClient(path=CHROMA_DIR)
+
+
+def _get_collection():
+    global _client, _collection
+    if _collection is None:
+        _client = _make_client()
+        _collection = _client.get_collection(
+            name=COLLECTION_NAME,
+            embedding_function=None,
+        )
+    return _collection
+
+
+def _load_int8_index():
+    global _int8_index
+    if _int8_index is None:
+        data = np.load(INT8_SIDECAR)
+        _int8_index = {
+            "ids": data["ids"],
+            "embeddings": data["embeddings"],
+            "lo": data["lo"],
+            "scale": data["scale"],
+        }
+    return _int8_index
+
+
+def search_manual_quantized(question: str, k: int = 5, oversample: int = 4):
+    """
+    Exact search over the int8-quantized sidecar index.
+
+    Scores all vectors in int8 (cheap, cache-friendly), keeps the top
+    oversample*k candidates, then reranks those with the full-precision
+    query against dequantized candidates. Documents for the winning ids
+    are fetched from Chroma.
+    """
+    index = _load_int8_index()
+    model = _get_model()
+
+    query = model.encode(question, convert_to_numpy=True, normalize_embeddings=True)
+
+    # Coarse pass: quantize the query the same way and score in integer space
+    query_int8 = np.round((query - index["lo"]) / index["scale"] - 128.0)
+    query_int8 = query_int8.clip(-128, 127).astype(np.int8)
+    coarse = index["embeddings"].astype(np.int32) @ query_int8.astype(np.int32)
+
+    n_candidates = min(len(coarse), max(k, oversample * k))
+    candidates = np.argpartition(-coarse, n_candidates - 1)[:n_candidates]
+
+    # Rerank: full-precision query against dequantized candidate vectors
+    dequantized = (index["embeddings"][candidates].astype(np.float32) + 128.0) \
+        * index["scale"] + index["lo"]
+    fine = dequantized @ query
+    top = candidates[np.argsort(-fine)[:k]]
+
+    top_ids = [str(i) for i in index["ids"][top]]
+    results = _get_collection().get(ids=top_ids, include=["documents", "metadatas"])
+    return doc_codec.inflate_results(results)
+
 
 def search_manual(question: str, k: int = 5):
-    # 1) Load same embedding model used for indexing
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-    # 2) Connect to Chroma and collection
-    client = chromadb.PersistentClient(path=CHROMA_DIR)
-    collection = client.get_collection(
-        name=COLLECTION_NAME,
-        embedding_function=None,
-    )
+    # 1) Same embedding model used for indexing (cached across calls)
+    model = _get_model()
+
+    # 2) Chroma collection (client opened once, reused across calls)
+    collection = _get_collection()
 
-    # 3) Encode query using the same `.encode`
+    # 3) Encode query using the same `.encode`; keep it as a numpy row —
+    # Chroma accepts arrays directly, so boxing every float via .tolist()
+    # just burns allocations
     query_embedding = model.encode(
         question,
-        convert_to_numpy=True
-    ).astype("float32").tolist()
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).reshape(1, -1)
 
     # 4) Query Chroma
     results = collection.query(
-        query_embeddings=[query_embedding],
+        query_embeddings=query_embedding,
         n_results=k,
         include=["documents", "metadatas", "distances"],
     )
-    return results
+    # Restore zstd-compressed chunk text for the returned hits, if any
+    return doc_codec.inflate_results(results)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,19 @@
+import asyncio
+import hashlib
+import logging
 import os
-import json
-import time
+import orjson
+import re
+import httpx
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception_type
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 from openai import RateLimitError, APIError
 from services.search_service import SearchService
+from services.cache_utils import TTLLRUCache
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,13 +22,60 @@ load_dotenv()
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "https://aiportalapi.stu-platform.live/jpe")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME", "GPT-4o-mini")
+AZURE_RPM = int(os.getenv("AZURE_RPM", "60"))  # requests/minute quota of the deployment
+
+# Token bucket sized to the deployment quota: concurrent prompts only
+# wait when they would actually exceed the rate limit
+_rate_limiter = AsyncLimiter(max_rate=AZURE_RPM, time_period=60)
 
-client = AzureOpenAI(
+# Async client with a pooled HTTP transport: requests no longer block the
+# event loop, and keep-alive connections reuse TLS sessions across turns
+client = AsyncAzureOpenAI(
     api_version="2024-07-01-preview",
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
     api_key=AZURE_OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    ),
 )
 
+# Shared SearchService: constructing one per function call would reload
+# the embedding model and reopen the Chroma client on every chat turn
+_search_service = None
+
+
+def _get_search_service() -> SearchService:
+    global _search_service
+    if _search_service is None:
+        _search_service = SearchService()
+    return _search_service
+
+
+# The model frequently re-issues search_documents with the same arguments
+# across clarification turns; memoizing the embed + Chroma + format
+# pipeline skips the whole retrieval path on repeats. TTL keeps entries
+# from outliving index rebuilds.
+_search_call_cache = TTLLRUCache(maxsize=1024, ttl=300.0)
+
+# STM family/part patterns, compiled once at module scope. These are plain
+# character classes, so the stdlib engine matches them without backtracking;
+# a Hyperscan/RE2 DFA would add a dependency for no measurable gain here.
+STM_FAMILY_RE = re.compile(r"\b(stm32|stm8)\b", re.IGNORECASE)
+STM_PART_RE = re.compile(r"\b(stm32[a-z0-9]+|stm8[a-z0-9]+)\b", re.IGNORECASE)
+
+
+def infer_source_filters_from_query(query: str):
+    """
+    Pull STM family/part tokens (e.g. 'stm32f103') out of a user query so
+    the vector search can be narrowed to the matching source documents.
+    Prefers specific part numbers over bare family names.
+    """
+    filters = {m.group(0).lower() for m in STM_PART_RE.finditer(query)}
+    if not filters:
+        filters = {m.group(0).lower() for m in STM_FAMILY_RE.finditer(query)}
+    return sorted(filters)
+
+
 # function schema that the model can call to trigger a local search
 # add more function schemas here as needed
 functions = [
@@ -44,17 +99,17 @@ functions = [
     stop=stop_after_attempt(5),
     reraise=True
 )
-def call_openai(messages, functions_arg=None, function_call="auto"):
-    return client.chat.completions.create(
+async def call_openai(messages, functions_arg=None, function_call="auto"):
+    return await client.chat.completions.create(
         model=AZURE_DEPLOYMENT_NAME,
         messages=messages,
         functions=functions_arg,
         function_call=function_call,
     )
 
-def handle_search_function_call(func_call, k_override: int | None = None):
+async def handle_search_function_call(func_call, k_override: int | None = None):
     """Parse arguments and call the local SearchService, honoring a server-provided k override."""
-    print("Function call received:", func_call)
+    logger.debug("Function call received: %s", func_call)
     # func_call may be an object or dict depending on SDK; normalize
     args_str = None
     if hasattr(func_call, "arguments"):
@@ -65,15 +120,28 @@ def handle_search_function_call(func_call, k_override: int | None = None):
         return {"error": "no function arguments provided"}
 
     try:
-        args = json.loads(args_str)
+        args = orjson.loads(args_str)
     except Exception as e:
         return {"error": f"invalid function arguments: {e}"}
 
     query = args.get("query")
     # Use server-provided k if supplied; otherwise fall back to client-sent value or default 5
     k = int(k_override or args.get("k", 5))
-    svc = SearchService()
-    raw_results = svc.search(query=query, k=k)
+    # Narrow the search to specific manuals when the query names an STM part
+    source_filters = infer_source_filters_from_query(query or "") or None
+
+    cache_key = hashlib.blake2b(
+        f"{query}|{k}|{source_filters}".encode(), digest_size=16
+    ).digest()
+    cached = _search_call_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # search_async routes the query through the micro-batching encoder,
+    # so concurrent chat turns share one batched embedding pass
+    raw_results = await _get_search_service().search_async(
+        query=query, k=k, source_filters=source_filters
+    )
     
     # Format results for better consumption
     formatted_results = []
@@ -91,9 +159,11 @@ def handle_search_function_call(func_call, k_override: int | None = None):
                 "score": 1 - distance if distance is not None else None
             })
     
-    return {"results": formatted_results, "raw": raw_results}
+    result = {"results": formatted_results, "raw": raw_results}
+    _search_call_cache.put(cache_key, result)
+    return result
 
-def chat_search_auto(prompt: str, k: int = 5):
+async def chat_search_auto(prompt: str, k: int = 5):
     """
     Use the model in function-call 'auto' mode. If the model calls 'search_documents',
     execute the search locally and return the final assistant response.
@@ -102,7 +172,7 @@ def chat_search_auto(prompt: str, k: int = 5):
     user_msg = {"role": "user", "content": prompt}
     try:
         # initial request lets the model decide whether to call the function
-        resp = call_openai([user_msg], functions_arg=functions, function_call="auto")
+        resp = await call_openai([user_msg], functions_arg=functions, function_call="auto")
     except Exception as e:
         return {"error": f"openai call failed: {e}"}, None
 
@@ -134,35 +204,42 @@ def chat_search_auto(prompt: str, k: int = 5):
 
     # If model requested a function call, execute it and send back result as a function role
     if func_call:
-        search_results = handle_search_function_call(func_call, k_override=k)
+        search_results = await handle_search_function_call(func_call, k_override=k)
         function_message = {
             "role": "function",
             "name": "search_documents",
-            "content": json.dumps(search_results)
+            # orjson serializes the (potentially large) result payload in
+            # native code and handles numpy scalars without a default hook
+            "content": orjson.dumps(
+                search_results, option=orjson.OPT_SERIALIZE_NUMPY
+            ).decode()
         }
         # Ask the model to produce a final assistant response after seeing the function output
-        final = call_openai([user_msg, function_message], functions_arg=None, function_call=None)
+        final = await call_openai([user_msg, function_message], functions_arg=None, function_call=None)
         return final, search_results
 
     # If no function call, return the model's original response
     return resp, None
 
 # simple batch helper for testing
-def batch_search(prompts):
-    outputs = []
-    for p in prompts:
+async def batch_search(prompts):
+    # Run prompts concurrently behind the token bucket; only requests
+    # that would exceed the deployment quota wait, instead of every
+    # request paying a fixed inter-call sleep
+    async def one(p):
         try:
-            final_resp, results = chat_search_auto(p)
-            outputs.append({"prompt": p, "assistant_response": final_resp, "search_results": results})
-            time.sleep(0.5)
+            async with _rate_limiter:
+                final_resp, results = await chat_search_auto(p)
+            return {"prompt": p, "assistant_response": final_resp, "search_results": results}
         except Exception as e:
-            outputs.append({"prompt": p, "error": str(e)})
-    return outputs
+            return {"prompt": p, "error": str(e)}
+
+    return list(await asyncio.gather(*(one(p) for p in prompts)))
 
 if __name__ == "__main__":
     examples = [
         "Find relevant STM32 manual snippets about setting up USART.",
         # "Search for 'I2C timing' best practice in the manual and return top 3."
     ]
-    out = batch_search(examples)
+    out = asyncio.run(batch_search(examples))
     print(out)
\ No newline at end of file
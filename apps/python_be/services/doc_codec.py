@@ -0,0 +1,81 @@
+"""
+Optional zstd compression for stored document chunks.
+
+Chroma persists documents as plain UTF-8, so large collections re-read a
+lot of raw text from SQLite. When the zstandard package is installed, the
+index writers store each chunk compressed in the documents column
+(base64, since Chroma only takes strings there) and mark the row with a
+small ZDOC_KEY boolean in metadata; the search paths decompress only the
+top-k hits actually returned. Keeping the blob out of metadata matters:
+metadata rides along in every metadata-only scan (the source listing)
+and in the search payloads forwarded to the LLM. Without zstandard
+everything falls back to plain text.
+
+No corpus-trained dictionary is used: technical English already compresses
+3x+ at the default level, and a dictionary would have to be shipped
+alongside the collection and kept in sync across rebuilds.
+"""
+import base64
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Metadata flag marking a row whose documents entry is base64 zstd
+ZDOC_KEY = "zdoc"
+
+_compressor: Optional[Any] = None
+_decompressor: Optional[Any] = None
+
+
+def compression_available() -> bool:
+    return zstandard is not None
+
+
+def compress_document(text: str) -> str:
+    """Compress chunk text to a base64 string for metadata storage."""
+    global _compressor
+    if _compressor is None:
+        _compressor = zstandard.ZstdCompressor(level=3)
+    return base64.b64encode(
+        _compressor.compress(text.encode("utf-8"))
+    ).decode("ascii")
+
+
+def decompress_document(value: str) -> str:
+    global _decompressor
+    if _decompressor is None:
+        _decompressor = zstandard.ZstdDecompressor()
+    return _decompressor.decompress(base64.b64decode(value)).decode("utf-8")
+
+
+def _inflate_row(row_docs, row_metas) -> None:
+    for i, (doc, meta) in enumerate(zip(row_docs, row_metas)):
+        # Pop the flag so it never leaks into API responses or the
+        # function-call payload forwarded to the LLM
+        if meta and meta.pop(ZDOC_KEY, None) and doc:
+            row_docs[i] = decompress_document(doc)
+
+
+def inflate_results(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Restore compressed documents in a Chroma query/get result, in place.
+
+    Handles both the nested per-query layout from collection.query and
+    the flat layout from collection.get. Rows written before compression
+    was enabled (or with zstandard unavailable) pass through untouched.
+    """
+    if zstandard is None or not results:
+        return results
+    docs = results.get("documents")
+    metas = results.get("metadatas")
+    if not docs or not metas:
+        return results
+    if isinstance(docs[0], list):
+        for row_docs, row_metas in zip(docs, metas):
+            _inflate_row(row_docs, row_metas)
+    else:
+        _inflate_row(docs, metas)
+    return results
@@ -0,0 +1,107 @@
+"""
+Embedding cache: in-memory LRU backed by an on-disk store.
+
+Entries are keyed by sha256(model_name, text) so embeddings from
+different models never collide. The disk layer (diskcache) survives
+process restarts, so prompts seen before a redeploy are served from disk
+instead of being re-embedded on the first request after it.
+"""
+
+import hashlib
+from collections import Counter, OrderedDict
+from threading import Lock
+from typing import Optional
+
+import numpy as np
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None  # Disk persistence is optional; fall back to memory only
+
+_DISK_CACHE_DIR = ".cache/embeddings"
+_DISK_CACHE_SIZE_LIMIT = 2 << 30  # 2GB
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + disk) cache for embedding vectors."""
+
+    def __init__(self, maxsize: int = 10_000, directory: str = _DISK_CACHE_DIR,
+                 warm_limit: int = 1000):
+        self.maxsize = maxsize
+        self.counters = Counter()
+        self._mem: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+        self._disk = None
+        if diskcache is not None:
+            try:
+                self._disk = diskcache.Cache(directory, size_limit=_DISK_CACHE_SIZE_LIMIT)
+                self._warm(warm_limit)
+            except Exception:
+                self._disk = None  # Never let cache setup break the service
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+    def _warm(self, limit: int) -> None:
+        """Preload up to `limit` persisted entries into the in-memory LRU."""
+        for i, key in enumerate(self._disk.iterkeys()):
+            if i >= limit:
+                break
+            value = self._disk.get(key)
+            if value is not None:
+                self._mem[key] = value
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding, or None on a full miss."""
+        key = self.make_key(model_name, text)
+        with self._lock:
+            emb = self._mem.get(key)
+            if emb is not None:
+                self._mem.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return emb
+
+        if self._disk is not None:
+            emb = self._disk.get(key)
+            if emb is not None:
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    self._mem[key] = emb
+                    while len(self._mem) > self.maxsize:
+                        self._mem.popitem(last=False)
+                return emb
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, model_name: str, text: str, embedding: np.ndarray) -> None:
+        """Store an embedding in both tiers."""
+        key = self.make_key(model_name, text)
+        with self._lock:
+            self._mem[key] = embedding
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.maxsize:
+                self._mem.popitem(last=False)
+        if self._disk is not None:
+            try:
+                self._disk.set(key, embedding)
+            except Exception:
+                pass  # Disk write failures must not fail the request
+
+    def stats(self) -> dict:
+        """Hit/miss counters and sizes for monitoring."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._mem),
+                "memory_maxsize": self.maxsize,
+                "disk_enabled": self._disk is not None,
+                **dict(self.counters),
+            }
+
+
+# Shared instance: one memory LRU and one disk store per process
+embedding_cache = EmbeddingCache()
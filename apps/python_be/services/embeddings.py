@@ -0,0 +1,29 @@
+"""
+Shared SentenceTransformer loading.
+
+IndexService and SearchService used to construct their own model
+instances (~80MB of weights plus tokenizer each), doubling RSS in a
+process that both indexes and searches. get_model hands out one cached
+instance per model name, so the weights are loaded and warmed once.
+"""
+from functools import lru_cache
+
+from sentence_transformers import SentenceTransformer
+
+
+@lru_cache(maxsize=1)
+def get_model(model_name: str) -> SentenceTransformer:
+    """Process-wide model instance, preferring the int8 ONNX weights.
+
+    The qint8 AVX-512 VNNI export runs the transformer matmuls with int8
+    dot products; fall back to the default backend when onnxruntime or
+    the quantized weights are unavailable.
+    """
+    try:
+        return SentenceTransformer(
+            model_name,
+            backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
+        )
+    except Exception:
+        return SentenceTransformer(model_name)
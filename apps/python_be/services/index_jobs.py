@@ -0,0 +1,105 @@
+"""
+Job queue for index builds.
+
+Index builds are CPU-heavy (PDF parsing + embedding) and previously ran
+inside the API process via FastAPI BackgroundTasks, which shares the GIL
+with the event loop and can pin an API worker for minutes. Builds are now
+submitted to a single-worker pool so the API stays responsive, and job
+status is tracked here instead of a route-level dict.
+
+The pool is a separate process only when a chroma-server sidecar is
+configured (CHROMA_HTTP_HOST): the embedded PersistentClient does not
+support two processes sharing one persist dir — the API process's cached
+HNSW segment would never see the worker's writes and concurrent SQLite
+writers can deadlock. Without the sidecar the build runs in a worker
+thread of the API process instead; the parsing pool and the native
+encode kernels release the GIL for the heavy parts.
+"""
+
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+# Single worker: index builds must not run concurrently (they share the
+# ChromaDB collection), so the pool itself serializes them.
+_executor: Optional[Executor] = None
+_current_job: Optional[Future] = None
+_last_result: Optional[Dict[str, Any]] = None
+
+# Makes the is_running check and the submit atomic, so two concurrent
+# callers can never both pass the check and double-start a build
+_enqueue_lock = threading.Lock()
+
+
+def _run_build(rebuild: bool = False, files: Optional[list] = None) -> Dict[str, Any]:
+    """Entry point executed inside the worker (process or thread)."""
+    # Import and construct the service in the worker so submission stays
+    # cheap (and, in the process case, nothing unpicklable crosses the
+    # process boundary).
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    from services.index_service import IndexService
+    service = IndexService()
+    if files is not None:
+        # Only the named files cross the process boundary (never contents);
+        # skips the full directory scan an incremental build would do
+        return service.index_files(files)
+    return service.build_index(rebuild=rebuild)
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if os.getenv("CHROMA_HTTP_HOST"):
+            # Sidecar topology: the worker process talks to chroma-server
+            # over HTTP, so full process isolation is safe
+            _executor = ProcessPoolExecutor(max_workers=1)
+        else:
+            # Embedded store: stay in-process so search sees the writes
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="index-build"
+            )
+    return _executor
+
+
+def _store_result(future: Future) -> None:
+    global _last_result
+    try:
+        _last_result = future.result()
+    except Exception as e:
+        _last_result = {
+            "success": False,
+            "error": f"Unexpected error during indexing: {str(e)}"
+        }
+
+
+def is_running() -> bool:
+    """Whether an index build is currently in progress."""
+    return _current_job is not None and not _current_job.done()
+
+
+def enqueue_build(rebuild: bool = False, files: Optional[list] = None) -> Optional[Future]:
+    """
+    Submit an index build to the worker process.
+
+    When `files` is given, only those files are chunked and embedded;
+    otherwise a directory-wide (incremental or full) build runs.
+    Returns the job Future, or None if a build is already running.
+    """
+    global _current_job
+    with _enqueue_lock:
+        if is_running():
+            return None
+        _current_job = _get_executor().submit(_run_build, rebuild, files)
+        _current_job.add_done_callback(_store_result)
+        return _current_job
+
+
+def get_status() -> Dict[str, Any]:
+    """Current job-queue status in the shape the status endpoint expects."""
+    running = is_running()
+    return {
+        "is_running": running,
+        "last_result": _last_result,
+        "progress": "Indexing in progress..." if running else None,
+    }
@@ -1,12 +1,169 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"  # Avoid huggingface complaint
-import glob
+import logging
+import numpy as np
 import pymupdf
 from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
 import chromadb
+import multiprocessing
+from functools import partial
 from pathlib import Path
 
+from services import doc_codec
+from services.embeddings import get_model
+
+logger = logging.getLogger(__name__)
+
+
+# Chunking helpers live at module level so they are picklable and can run
+# in worker processes during a parallel build.
+
+def split_text_into_chunks(text: str, max_chars: int, overlap: int) -> List[str]:
+    """Split text into overlapping chunks.
+
+    Chunks accumulate in a list buffer with a running length counter and
+    are joined once at flush time; repeated `current += p` re-copies the
+    whole growing string each iteration, which is quadratic on long
+    texts. The overlap is paragraph-aligned: whole paragraphs are carried
+    from the end of the flushed chunk until their combined length reaches
+    `overlap`, instead of slicing mid-character.
+    """
+    paras = [p.strip() for p in text.split("\n") if p.strip()]
+    chunks: List[str] = []
+    buf: List[str] = []
+    buf_len = 0
+    for p in paras:
+        if buf_len + len(p) + 1 > max_chars:
+            chunks.append("\n".join(buf))
+            # seed the next buffer with trailing paragraphs as overlap
+            tail: List[str] = []
+            tail_len = 0
+            for prev in reversed(buf):
+                if tail_len >= overlap:
+                    break
+                tail.append(prev)
+                tail_len += len(prev) + 1
+            buf = list(reversed(tail))
+            buf.append(p)
+            buf_len = tail_len + len(p) + 1
+        else:
+            buf.append(p)
+            buf_len += len(p) + 1
+    if buf:
+        chunks.append("\n".join(buf))
+    return chunks
+
+
+def load_and_chunk_pdf(pdf_path: str, max_chars: int, overlap: int) -> tuple[List[Dict], int]:
+    """
+    Load a PDF and split each page into overlapping text chunks.
+    Returns a list of dicts: {page, text, source} and page count.
+    """
+    doc = pymupdf.open(pdf_path)
+    pages = []
+    for i, page in enumerate(doc):
+        # "blocks" skips part of MuPDF's layout reconstruction and yields
+        # paragraph-aligned segments (type 0 = text), which chunk better
+        # than the interleaved "text" mode output
+        blocks = page.get_text("blocks")
+        text = "\n".join(b[4] for b in blocks if b[6] == 0)
+        pages.append({"page": i + 1, "text": text})
+
+    all_chunks = []
+    src_name = os.path.basename(pdf_path)
+    for page in pages:
+        for chunk in split_text_into_chunks(page["text"], max_chars, overlap):
+            all_chunks.append({
+                "page": page["page"],
+                "text": chunk,
+                "source": src_name,
+            })
+
+    return all_chunks, len(pages)
+
+
+def load_and_chunk_txt(txt_path: str, max_chars: int, overlap: int) -> tuple[List[Dict], int]:
+    """
+    Load a TXT file and split into overlapping text chunks.
+    Returns a list of dicts: {page, text, source} and "page" count (always 1).
+    """
+    with open(txt_path, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+
+    all_chunks = []
+    src_name = os.path.basename(txt_path)
+    for chunk in split_text_into_chunks(text, max_chars, overlap):
+        all_chunks.append({
+            "page": 1,  # TXT files don't have pages
+            "text": chunk,
+            "source": src_name,
+        })
+
+    return all_chunks, 1
+
+
+def load_and_chunk_docx(docx_path: str, max_chars: int, overlap: int) -> tuple[List[Dict], int]:
+    """
+    Load a DOCX file and split into overlapping text chunks.
+    Returns a list of dicts: {page, text, source} and "page" count (paragraph count).
+    """
+    try:
+        from docx import Document
+    except ImportError:
+        raise ImportError("python-docx is required for DOCX support. Install: pip install python-docx")
+
+    doc = Document(docx_path)
+    paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+    text = "\n".join(paragraphs)
+
+    # %-style args are only formatted when the level is enabled, so this
+    # costs nothing in production
+    logger.debug("Extracted %d chars from %s", len(text), os.path.basename(docx_path))
+    logger.debug("First 200 chars: %s", text[:200])
+
+    if not text.strip():
+        logger.warning("No text extracted from %s", docx_path)
+        return [], 0
+
+    all_chunks = []
+    src_name = os.path.basename(docx_path)
+    for chunk in split_text_into_chunks(text, max_chars, overlap):
+        all_chunks.append({
+            "page": 1,  # DOCX files don't have traditional pages
+            "text": chunk,
+            "source": src_name,
+        })
+
+    logger.debug("Created %d chunks from %s", len(all_chunks), src_name)
+    return all_chunks, len(paragraphs)
+
+
+def load_and_chunk_file(file_path: str, max_chars: int, overlap: int) -> tuple[List[Dict], int]:
+    """
+    Load and chunk a file based on its extension.
+    Returns chunks and page/section count.
+    """
+    ext = Path(file_path).suffix.lower()
+
+    if ext == '.pdf':
+        return load_and_chunk_pdf(file_path, max_chars, overlap)
+    elif ext == '.txt':
+        return load_and_chunk_txt(file_path, max_chars, overlap)
+    elif ext in ['.docx', '.doc']:
+        return load_and_chunk_docx(file_path, max_chars, overlap)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+
+def _load_and_chunk_file_safe(file_path: str, max_chars: int, overlap: int):
+    """Worker wrapper: capture per-file failures instead of poisoning the
+    whole pool.map result."""
+    try:
+        chunks, pages = load_and_chunk_file(file_path, max_chars, overlap)
+        return chunks, pages, None
+    except Exception as e:
+        return [], 0, str(e)
+
 
 class IndexService:
     def __init__(self):
@@ -16,123 +173,261 @@ class IndexService:
         self.embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
         self.max_chars = 1500
         self.overlap = 200
-        
+        self.embed_batch_size = 256
+        # Above this many chunks, fan the encode out across CPU worker
+        # processes; below it the pool startup cost outweighs the win
+        self.multi_process_threshold = 1000
+
         # Initialize model
         self.model = None
+        self._client = None
     
     def _load_model(self):
-        """Lazy load the embedding model."""
+        """Lazy load the embedding model (shared with SearchService)."""
         if self.model is None:
-            self.model = SentenceTransformer(self.embedding_model_name)
+            self.model = get_model(self.embedding_model_name)
         return self.model
     
     def _split_into_chunks(self, text: str) -> List[str]:
         """Split text into overlapping chunks."""
-        paras = [p.strip() for p in text.split("\n") if p.strip()]
-        chunks, current = [], ""
-        for p in paras:
-            if len(current) + len(p) + 1 > self.max_chars:
-                chunks.append(current)
-                # keep some tail as overlap
-                current = current[-self.overlap:] + "\n" + p
-            else:
-                current += "\n" + p if current else p
-        if current:
-            chunks.append(current)
-        return chunks
-    
-    def _load_and_chunk_pdf(self, pdf_path: str) -> tuple[List[Dict], int]:
-        """
-        Load a PDF and split each page into overlapping text chunks.
-        Returns a list of dicts: {page, text, source} and page count.
+        return split_text_into_chunks(text, self.max_chars, self.overlap)
+
+    def _embed_batch(self, texts: List[str]):
         """
-        doc = pymupdf.open(pdf_path)
-        pages = []
-        for i, page in enumerate(doc):
-            text = page.get_text("text")
-            pages.append({"page": i + 1, "text": text})
-        
-        all_chunks = []
-        src_name = os.path.basename(pdf_path)
-        for page in pages:
-            for chunk in self._split_into_chunks(page["text"]):
-                all_chunks.append({
-                    "page": page["page"],
-                    "text": chunk,
-                    "source": src_name,
-                })
-        
-        return all_chunks, len(pages)
-    
-    def _load_and_chunk_txt(self, txt_path: str) -> tuple[List[Dict], int]:
+        Encode a batch of texts in one call.
+
+        All chunks collected across files are embedded together, in
+        mini-batches of embed_batch_size, rather than per chunk or per
+        file — one model invocation per build instead of hundreds.
+
+        Texts are encoded in length-sorted order so each mini-batch holds
+        similarly sized chunks (short chunks are no longer padded to the
+        longest in the batch), then scattered back to the input order.
         """
-        Load a TXT file and split into overlapping text chunks.
-        Returns a list of dicts: {page, text, source} and "page" count (always 1).
+        model = self._load_model()
+        order = np.argsort([len(t) for t in texts])
+        sorted_texts = [texts[i] for i in order]
+
+        sorted_embeddings = None
+        if len(texts) > self.multi_process_threshold:
+            # Each worker runs an independent encoder on its shard of the
+            # sorted texts, bypassing the GIL for the forward pass
+            try:
+                pool = model.start_multi_process_pool(
+                    target_devices=["cpu"] * (os.cpu_count() or 1)
+                )
+                try:
+                    sorted_embeddings = model.encode_multi_process(
+                        sorted_texts,
+                        pool,
+                        batch_size=32,
+                        chunk_size=500,
+                        normalize_embeddings=True,
+                    )
+                finally:
+                    model.stop_multi_process_pool(pool)
+            except Exception:
+                sorted_embeddings = None  # fall back to in-process encode
+
+        if sorted_embeddings is None:
+            sorted_embeddings = model.encode(
+                sorted_texts,
+                batch_size=self.embed_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+
+        # fp16 round-trip: halves the effective precision (harmless for
+        # normalized MiniLM vectors) while keeping the float32 dtype
+        # Chroma expects on the wire
+        embeddings = np.empty(sorted_embeddings.shape, dtype="float32")
+        embeddings[order] = sorted_embeddings.astype(np.float16).astype("float32")
+        return embeddings
+
+    def _load_and_chunk_file(self, file_path: str) -> tuple[List[Dict], int]:
         """
-        with open(txt_path, 'r', encoding='utf-8', errors='ignore') as f:
-            text = f.read()
-        
-        all_chunks = []
-        src_name = os.path.basename(txt_path)
-        for chunk in self._split_into_chunks(text):
-            all_chunks.append({
-                "page": 1,  # TXT files don't have pages
-                "text": chunk,
-                "source": src_name,
-            })
-        
-        return all_chunks, 1
-    
-    def _load_and_chunk_docx(self, docx_path: str) -> tuple[List[Dict], int]:
+        Load and chunk a file based on its extension.
+        Returns chunks and page/section count.
         """
-        Load a DOCX file and split into overlapping text chunks.
-        Returns a list of dicts: {page, text, source} and "page" count (paragraph count).
+        return load_and_chunk_file(file_path, self.max_chars, self.overlap)
+
+    # Rows per collection.add call: keeps each SQLite transaction in
+    # Chroma's batcher sweet spot and bounds the floats boxed per call
+    ADD_BATCH = 200
+
+    def _add_batched(self, collection, ids, documents, metadatas, embeddings) -> None:
+        """Add rows to the collection in ADD_BATCH-sized slices.
+
+        Embedding slices go to Chroma as numpy views — no per-float
+        PyFloat boxing and no transient list copy of the matrix.
         """
+        for i in range(0, len(ids), self.ADD_BATCH):
+            j = i + self.ADD_BATCH
+            collection.add(
+                ids=ids[i:j],
+                documents=documents[i:j],
+                metadatas=metadatas[i:j],
+                embeddings=embeddings[i:j],
+            )
+
+    @staticmethod
+    def _stored_documents(texts: List[str]) -> List[str]:
+        """Documents column to persist: base64 zstd when compression is
+        available (flagged per row in metadata), plain text otherwise."""
+        if doc_codec.compression_available():
+            return [doc_codec.compress_document(t) for t in texts]
+        return texts
+
+    def _make_client(self):
+        """HttpClient against a chroma-server sidecar when CHROMA_HTTP_HOST
+        is set, embedded PersistentClient otherwise. Must match the branch
+        in SearchService so ingestion and search hit the same store."""
+        host = os.getenv("CHROMA_HTTP_HOST")
+        if host:
+            return chromadb.HttpClient(
+                host=host, port=int(os.getenv("CHROMA_HTTP_PORT", "8000"))
+            )
+        return chromadb.PersistentClient(path=self.chroma_dir)
+
+    def _connect_collection(self):
+        """Open the ChromaDB collection (no embedding function; we precompute)."""
+        self._client = self._make_client()
+        return self._client.get_or_create_collection(
+            name=self.collection_name,
+            embedding_function=None,
+            # All vectors are unit-normalized, so inner product gives the
+            # cosine ranking without per-candidate norm/sqrt work in HNSW
+            metadata={"hnsw:space": "ip"},
+        )
+
+    @staticmethod
+    def _is_source_indexed(collection, file_name: str) -> bool:
+        """Membership probe for one source file: a single filtered row
+        with no payload columns, instead of materializing every metadata
+        row in the collection."""
         try:
-            from docx import Document
-        except ImportError:
-            raise ImportError("python-docx is required for DOCX support. Install: pip install python-docx")
-        
-        doc = Document(docx_path)
-        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-        text = "\n".join(paragraphs)
-        
-        # Debug: log extracted text length
-        print(f"[DEBUG] Extracted {len(text)} chars from {os.path.basename(docx_path)}")
-        print(f"[DEBUG] First 200 chars: {text[:200]}")
-        
-        if not text.strip():
-            print(f"[WARNING] No text extracted from {docx_path}")
-            return [], 0
-        
-        all_chunks = []
-        src_name = os.path.basename(docx_path)
-        for chunk in self._split_into_chunks(text):
-            all_chunks.append({
-                "page": 1,  # DOCX files don't have traditional pages
-                "text": chunk,
-                "source": src_name,
-            })
-        
-        print(f"[DEBUG] Created {len(all_chunks)} chunks from {src_name}")
-        return all_chunks, len(paragraphs)
-    
-    def _load_and_chunk_file(self, file_path: str) -> tuple[List[Dict], int]:
+            return bool(
+                collection.get(
+                    where={"source": file_name}, limit=1, include=[]
+                ).get("ids")
+            )
+        except Exception:
+            return False
+
+    def _next_chunk_idx(self, collection) -> int:
+        """Next free chunk index.
+
+        Ids are sequential `chunk_{i}` and rows are never deleted outside
+        a full rebuild, so the row count is the next index — no need to
+        materialize every id and max() over the split suffixes.
         """
-        Load and chunk a file based on its extension.
-        Returns chunks and page/section count.
+        return collection.count()
+
+    def index_files(self, file_paths: List[str]) -> Dict[str, Any]:
         """
-        ext = Path(file_path).suffix.lower()
-        
-        if ext == '.pdf':
-            return self._load_and_chunk_pdf(file_path)
-        elif ext == '.txt':
-            return self._load_and_chunk_txt(file_path)
-        elif ext in ['.docx', '.doc']:
-            return self._load_and_chunk_docx(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {ext}")
-    
+        Chunk, embed, and store a known set of files.
+
+        Used by the upload path: the uploaded filenames are already known,
+        so there is no need to re-scan the document directory or fetch the
+        full set of indexed sources the way build_index does.
+
+        Returns:
+            Dictionary containing build statistics and status
+        """
+        try:
+            collection = self._connect_collection()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to connect to ChromaDB: {str(e)}"
+            }
+
+        all_texts: List[str] = []
+        all_metadatas: List[Dict] = []
+        all_ids: List[str] = []
+        file_stats = []
+        chunk_idx = self._next_chunk_idx(collection)
+
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            if not os.path.isfile(file_path):
+                continue  # deleted between upload and the debounced build
+
+            try:
+                chunks, pages = self._load_and_chunk_file(file_path)
+                file_stats.append({
+                    "filename": file_name,
+                    "pages": pages,
+                    "chunks": len(chunks)
+                })
+
+                for c in chunks:
+                    all_texts.append(c["text"])
+                    meta = {
+                        "page": c["page"],
+                        "source": c["source"],
+                        "file_path": file_path,
+                    }
+                    if doc_codec.compression_available():
+                        meta[doc_codec.ZDOC_KEY] = True
+                    all_metadatas.append(meta)
+                    all_ids.append(f"chunk_{chunk_idx}")
+                    chunk_idx += 1
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"Error processing {file_name}: {str(e)}",
+                    "files_processed": file_stats
+                }
+
+        if not all_texts:
+            old_count = collection.count()
+            return {
+                "success": True,
+                "message": "No new files to index",
+                "total_chunks": old_count,
+                "previous_chunks": old_count,
+                "files_processed": file_stats,
+                "embedding_model": self.embedding_model_name,
+                "collection_name": self.collection_name
+            }
+
+        try:
+            doc_embeddings = self._embed_batch(all_texts)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to encode documents: {str(e)}",
+                "files_processed": file_stats
+            }
+
+        try:
+            old_count = collection.count()
+            self._add_batched(
+                collection,
+                all_ids,
+                # Documents go in compressed (base64 zstd) when available
+                self._stored_documents(all_texts),
+                all_metadatas,
+                doc_embeddings,
+            )
+            return {
+                "success": True,
+                "message": "Index built successfully",
+                "total_chunks": collection.count(),
+                "previous_chunks": old_count,
+                "files_processed": file_stats,
+                "embedding_model": self.embedding_model_name,
+                "collection_name": self.collection_name
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to update ChromaDB collection: {str(e)}",
+                "files_processed": file_stats
+            }
+
     def build_index(self, rebuild: bool = False) -> Dict[str, Any]:
         """
         Build the search index from all PDFs in the document_source directory.
@@ -152,13 +447,15 @@ class IndexService:
                 "message": "Please create the directory and add PDF files."
             }
         
-        # Find all supported document files
-        supported_extensions = ['*.pdf', '*.txt', '*.docx', '*.doc']
-        all_files = []
-        for ext in supported_extensions:
-            all_files.extend(glob.glob(os.path.join(self.document_dir, ext)))
-        
-        doc_files = sorted(all_files)
+        # Find all supported document files in one directory pass; four
+        # glob.glob calls would re-list the directory per extension
+        supported_extensions = {'.pdf', '.txt', '.docx', '.doc'}
+        with os.scandir(self.document_dir) as entries:
+            doc_files = sorted(
+                entry.path for entry in entries
+                if entry.is_file()
+                and Path(entry.name).suffix.lower() in supported_extensions
+            )
         if not doc_files:
             return {
                 "success": False,
@@ -168,75 +465,77 @@ class IndexService:
         
         # Connect to collection
         try:
-            client = chromadb.PersistentClient(path=self.chroma_dir)
-            collection = client.get_or_create_collection(
-                name=self.collection_name,
-                embedding_function=None,
-            )
+            collection = self._connect_collection()
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Failed to connect to ChromaDB: {str(e)}"
             }
         
-        # Get list of already indexed sources (if not rebuilding)
-        indexed_sources = set()
-        if not rebuild:
-            try:
-                existing_data = collection.get()
-                if existing_data.get("metadatas"):
-                    for meta in existing_data["metadatas"]:
-                        if "source" in meta:
-                            indexed_sources.add(meta["source"])
-            except Exception:
-                pass  # Collection is empty or new
-        
         # Collect chunks from PDFs
         all_texts: List[str] = []
         all_metadatas: List[Dict] = []
         all_ids: List[str] = []
         file_stats = []
         
-        # Get the highest existing chunk index
-        chunk_idx = 0
-        if not rebuild:
-            try:
-                existing_ids = collection.get().get("ids", [])
-                if existing_ids:
-                    chunk_idx = max(int(id.split("_")[1]) for id in existing_ids if "_" in id) + 1
-            except (ValueError, IndexError, AttributeError):
-                chunk_idx = len(collection.get().get("ids", []))
+        # Get the next chunk index (0 when rebuilding from scratch)
+        chunk_idx = self._next_chunk_idx(collection) if not rebuild else 0
         
-        for file_path in doc_files:
+        # Files that still need parsing (skip already indexed when not rebuilding)
+        pending_files = [
+            f for f in doc_files
+            if rebuild or not self._is_source_indexed(collection, os.path.basename(f))
+        ]
+
+        # Text extraction is CPU-bound and independent per file: parse in
+        # a worker pool (map preserves input order, so chunk ids assigned
+        # during aggregation stay deterministic)
+        parse_results = []
+        if pending_files:
+            workers = min(len(pending_files), max(1, (os.cpu_count() or 2) - 1))
+            if workers > 1:
+                with multiprocessing.Pool(workers) as pool:
+                    parse_results = pool.map(
+                        partial(
+                            _load_and_chunk_file_safe,
+                            max_chars=self.max_chars,
+                            overlap=self.overlap,
+                        ),
+                        pending_files,
+                    )
+            else:
+                parse_results = [
+                    _load_and_chunk_file_safe(f, self.max_chars, self.overlap)
+                    for f in pending_files
+                ]
+
+        for file_path, (chunks, pages, error) in zip(pending_files, parse_results):
             file_name = os.path.basename(file_path)
-            
-            # Skip if already indexed (when not rebuilding)
-            if not rebuild and file_name in indexed_sources:
-                continue
-            
-            try:
-                chunks, pages = self._load_and_chunk_file(file_path)
-                file_stats.append({
-                    "filename": file_name,
-                    "pages": pages,
-                    "chunks": len(chunks)
-                })
-                
-                for c in chunks:
-                    all_texts.append(c["text"])
-                    all_metadatas.append({
-                        "page": c["page"],
-                        "source": c["source"],
-                        "file_path": file_path,
-                    })
-                    all_ids.append(f"chunk_{chunk_idx}")
-                    chunk_idx += 1
-            except Exception as e:
+            if error is not None:
                 return {
                     "success": False,
-                    "error": f"Error processing {file_name}: {str(e)}",
+                    "error": f"Error processing {file_name}: {error}",
                     "files_processed": file_stats
                 }
+
+            file_stats.append({
+                "filename": file_name,
+                "pages": pages,
+                "chunks": len(chunks)
+            })
+
+            for c in chunks:
+                all_texts.append(c["text"])
+                meta = {
+                    "page": c["page"],
+                    "source": c["source"],
+                    "file_path": file_path,
+                }
+                if doc_codec.compression_available():
+                    meta[doc_codec.ZDOC_KEY] = True
+                all_metadatas.append(meta)
+                all_ids.append(f"chunk_{chunk_idx}")
+                chunk_idx += 1
         
         if not all_texts:
             old_count = collection.count()
@@ -259,21 +558,16 @@ class IndexService:
         
         # Load embedding model
         try:
-            model = self._load_model()
+            self._load_model()
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Failed to load embedding model: {str(e)}"
             }
-        
-        # Encode document chunks
+
+        # Encode all document chunks in one batched call
         try:
-            doc_embeddings = model.encode(
-                all_texts,
-                convert_to_numpy=True,
-                show_progress_bar=False
-            )
-            doc_embeddings = doc_embeddings.astype("float32")
+            doc_embeddings = self._embed_batch(all_texts)
         except Exception as e:
             return {
                 "success": False,
@@ -285,23 +579,28 @@ class IndexService:
         try:
             old_count = collection.count()
             
-            # Clear all data if rebuilding
+            # Clear all data if rebuilding: a server-side drop replaces
+            # fetching every id and round-tripping them back as deletes
             if rebuild and old_count > 0:
                 try:
-                    existing = collection.get()
-                    existing_ids = existing.get("ids", [])
-                    if existing_ids:
-                        collection.delete(ids=existing_ids)
+                    self._client.delete_collection(self.collection_name)
+                    collection = self._client.create_collection(
+                        name=self.collection_name,
+                        embedding_function=None,
+                        metadata={"hnsw:space": "ip"},
+                    )
                 except Exception:
                     pass
                 old_count = 0
             
             # Add new data to collection
-            collection.add(
-                ids=all_ids,
-                documents=all_texts,
-                metadatas=all_metadatas,
-                embeddings=doc_embeddings.tolist(),
+            self._add_batched(
+                collection,
+                all_ids,
+                # Documents go in compressed (base64 zstd) when available
+                self._stored_documents(all_texts),
+                all_metadatas,
+                doc_embeddings,
             )
             
             new_count = collection.count()
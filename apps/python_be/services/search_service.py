@@ -1,24 +1,64 @@
+import asyncio
+import os
+
 import chromadb
-from sentence_transformers import SentenceTransformer
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+from services import doc_codec
+from services.embeddings import get_model
 
 class SearchService:
+    # Micro-batching window for concurrent query encodes: coalesce
+    # in-flight queries for up to 10 ms / 32 items before calling encode
+    ENCODE_BATCH_MAX = 32
+    ENCODE_WINDOW_SECONDS = 0.010
+
     def __init__(self):
         self.chroma_dir = "./chroma_stm32"
         self.collection_name = "stm32_manual_embedding"
         self.embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        
-        # Initialize model and client (lazy load collection)
-        self.model = SentenceTransformer(self.embedding_model_name)
-        self.client = chromadb.PersistentClient(path=self.chroma_dir)
+
+        # Initialize model and client (lazy load collection). The model
+        # comes from the shared process-wide cache, so a process that both
+        # indexes and searches loads the weights once.
+        self.model = get_model(self.embedding_model_name)
+        self.client = self._make_client()
         self._collection: Optional[Any] = None
-    
+
+        # Created lazily on the running loop by search_async
+        self._encode_queue: Optional[asyncio.Queue] = None
+        self._encode_worker_task: Optional[asyncio.Task] = None
+
+        # Source list cache, invalidated when the collection row count
+        # changes; saves the O(N) metadata materialization per query
+        self._sources_cache: Optional[List[str]] = None
+        self._sources_cache_count: int = -1
+
+        # Trigram postings over lowercased source filenames, rebuilt
+        # whenever the source list changes; turns substring matching into
+        # a postings intersection plus verification on a tiny candidate set
+        self._trigram_sources: Optional[List[str]] = None
+        self._trigram_postings: Dict[str, set] = {}
+        self._source_lower: Dict[str, str] = {}
+
+    def _make_client(self):
+        """HttpClient against a chroma-server sidecar when CHROMA_HTTP_HOST
+        is set, embedded PersistentClient otherwise."""
+        host = os.getenv("CHROMA_HTTP_HOST")
+        if host:
+            return chromadb.HttpClient(
+                host=host, port=int(os.getenv("CHROMA_HTTP_PORT", "8000"))
+            )
+        return chromadb.PersistentClient(path=self.chroma_dir)
+
     def _get_collection(self):
         """Lazy load the collection on first use."""
         if self._collection is None:
             self._collection = self.client.get_or_create_collection(
                 name=self.collection_name,
                 embedding_function=None,
+                # Unit vectors + inner product == cosine without the sqrt
+                metadata={"hnsw:space": "ip"},
             )
         return self._collection
     
@@ -26,52 +66,248 @@ class SearchService:
     def collection(self):
         """Property to access collection with lazy loading."""
         return self._get_collection()
-    
-    def search(self, query: str, k: int = 5) -> Dict[str, Any]:
+
+    def _reset_collection_cache(self) -> None:
+        """Drop cached handles so the next access re-resolves them."""
+        self._collection = None
+        self._sources_cache = None
+        self._sources_cache_count = -1
+
+    def _with_collection_retry(self, op):
+        """Run op(collection), re-resolving the handle once on failure.
+
+        A full rebuild drops and recreates the collection server-side,
+        which invalidates the handle cached by long-lived service
+        instances (the route and chat singletons). Retrying against a
+        fresh handle keeps search working across rebuilds without a
+        process restart.
+        """
+        try:
+            return op(self._get_collection())
+        except Exception:
+            self._reset_collection_cache()
+            return op(self._get_collection())
+
+    def _get_all_sources(self) -> List[str]:
+        """Return the distinct source filenames present in the collection.
+
+        Cached on the instance and refreshed only when collection.count()
+        changes (rows are append-only outside full rebuilds), so the
+        per-query cost is one count() call instead of materializing every
+        metadata row.
+        """
+        count = self._with_collection_retry(lambda c: c.count())
+        if count == self._sources_cache_count and self._sources_cache is not None:
+            return self._sources_cache
+
+        data = self._with_collection_retry(lambda c: c.get(include=["metadatas"]))
+        sources = set()
+        for meta in data.get("metadatas") or []:
+            if "source" in meta:
+                sources.add(meta["source"])
+        self._sources_cache = sorted(sources)
+        self._sources_cache_count = count
+        return self._sources_cache
+
+    def _get_trigram_postings(self, all_sources: List[str]) -> Dict[str, set]:
+        """Build (or reuse) the trigram -> {source} postings index and the
+        precomputed lowercase names used for verification."""
+        if all_sources != self._trigram_sources:
+            postings: Dict[str, set] = {}
+            lower: Dict[str, str] = {}
+            for source in all_sources:
+                low = source.lower()
+                lower[source] = low
+                for i in range(len(low) - 2):
+                    postings.setdefault(low[i:i + 3], set()).add(source)
+            self._trigram_postings = postings
+            self._source_lower = lower
+            self._trigram_sources = all_sources
+        return self._trigram_postings
+
+    def _match_sources_partial(self, needles: List[str]) -> List[str]:
+        """
+        Match lowercase needles (e.g. 'stm32f103') as substrings of the
+        source filenames, returning the matching sources.
+
+        Needles of 3+ chars go through the trigram index: intersect the
+        postings of the needle's trigrams, then verify the substring on
+        the (small) candidate set instead of scanning every filename.
+        Lowercased names come from the cache built with the index, so no
+        per-query re-lowercasing.
+        """
+        all_sources = self._get_all_sources()
+        postings = self._get_trigram_postings(all_sources)
+        lower = self._source_lower
+
+        matched: set = set()
+        for needle in needles:
+            if len(needle) < 3:
+                matched.update(s for s in all_sources if needle in lower[s])
+                continue
+            candidates: Optional[set] = None
+            for i in range(len(needle) - 2):
+                bucket = postings.get(needle[i:i + 3], set())
+                candidates = bucket if candidates is None else candidates & bucket
+                if not candidates:
+                    break
+            matched.update(s for s in candidates or () if needle in lower[s])
+
+        return sorted(matched)
+
+    @staticmethod
+    def _trim_results(results: Dict[str, Any], k: int) -> Dict[str, Any]:
+        """Trim oversampled query results down to the top k."""
+        for field in ("ids", "documents", "metadatas", "distances"):
+            if results.get(field):
+                results[field] = [results[field][0][:k]]
+        return results
+
+    async def _embed_query_batched(self, query: str):
+        """
+        Encode a query through the micro-batching worker. Concurrent
+        callers within the coalescing window share one model.encode call
+        instead of each paying a batch-size-1 forward pass.
+        """
+        loop = asyncio.get_running_loop()
+        if self._encode_queue is None:
+            self._encode_queue = asyncio.Queue()
+            self._encode_worker_task = loop.create_task(self._encode_worker())
+        future: asyncio.Future = loop.create_future()
+        self._encode_queue.put_nowait((query, future))
+        return await future
+
+    async def _encode_worker(self):
+        """Drain pending queries (up to ENCODE_BATCH_MAX items or
+        ENCODE_WINDOW_SECONDS) and resolve their futures from one batched
+        encode run in a worker thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._encode_queue.get()]
+            deadline = loop.time() + self.ENCODE_WINDOW_SECONDS
+            while len(batch) < self.ENCODE_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._encode_queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                embeddings = await asyncio.to_thread(
+                    self.model.encode,
+                    [q for q, _ in batch],
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    batch_size=self.ENCODE_BATCH_MAX,
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    async def search_async(
+        self,
+        query: str,
+        k: int = 5,
+        source_filters: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Async variant of search(): the query embedding goes through the
+        micro-batching encoder and the Chroma query runs off the loop."""
+        query_embedding = await self._embed_query_batched(query)
+        return await asyncio.to_thread(
+            self._query_with_embedding,
+            query_embedding.astype("float32").tolist(),
+            k,
+            source_filters,
+        )
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        source_filters: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
         """
         Search the document collection for relevant chunks.
-        
+
         Args:
             query: Search query text
             k: Number of results to return
-            
+            source_filters: Optional lowercase substrings (e.g. 'stm32f103')
+                used to restrict results to matching source documents
+
         Returns:
             Dictionary containing search results
         """
-        # Encode query
+        # Encode query (normalized, matching the stored unit vectors)
         query_embedding = self.model.encode(
             query,
-            convert_to_numpy=True
+            convert_to_numpy=True,
+            normalize_embeddings=True,
         ).astype("float32").tolist()
-        
-        # Query Chroma
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k,
-            include=["documents", "metadatas", "distances"],
-        )
-        
-        return results
+
+        return self._query_with_embedding(query_embedding, k, source_filters)
+
+    def _query_with_embedding(
+        self,
+        query_embedding,
+        k: int,
+        source_filters: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        # Resolve source filters to a Chroma where clause
+        where = None
+        if source_filters:
+            matched = self._match_sources_partial([n.lower() for n in source_filters])
+            if len(matched) == 1:
+                where = {"source": matched[0]}
+            elif matched:
+                where = {"source": {"$in": matched}}
+
+        # Chroma applies the where filter inside the HNSW search, so ask
+        # for exactly k; oversample only on the retry path below
+        try:
+            results = self._with_collection_retry(lambda c: c.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas", "distances"],
+            ))
+        except Exception:
+            if where is None:
+                raise
+            # Fallback for filter-challenged backends: modest oversample
+            # without the filter, then trim to k after the fact
+            results = self._with_collection_retry(lambda c: c.query(
+                query_embeddings=[query_embedding],
+                n_results=k * 2,
+                include=["documents", "metadatas", "distances"],
+            ))
+            results = self._trim_results(results, k)
+
+        # Restore zstd-compressed chunk text for the returned hits, if any
+        return doc_codec.inflate_results(results)
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the document collection."""
-        count = self.collection.count()
-        
-        # Get ALL documents to determine all available sources
-        if count > 0:
-            sample = self.collection.get()
-        else:
-            sample = {"metadatas": []}
-        
-        sources = set()
-        if sample.get("metadatas"):
-            for meta in sample["metadatas"]:
-                if "source" in meta:
-                    sources.add(meta["source"])
-        
+        count = self._with_collection_retry(lambda c: c.count())
+
+        # Source names come from the cached metadata-only scan; the old
+        # bare collection.get() also deserialized every document string
+        # just to be thrown away
+        sources = self._get_all_sources() if count > 0 else []
+
         return {
             "total_chunks": count,
             "collection_name": self.collection_name,
             "embedding_model": self.embedding_model_name,
-            "sources": sorted(list(sources))
+            "sources": sources
         }
@@ -0,0 +1,125 @@
+"""
+Approximate (semantic) response cache for chat prompts.
+
+The exact-match cache only helps byte-identical prompts; "What is X?" and
+"Please explain X" still miss it. This SIM-LRU cache keys entries by the
+prompt's embedding and serves the stored response of the nearest previous
+prompt when its cosine distance is within a threshold, skipping both the
+LLM call and the vector search.
+"""
+
+import asyncio
+
+import numpy as np
+from threading import Lock
+from typing import Any, Optional
+
+from services.embedding_cache import embedding_cache
+from services.embeddings import get_model
+
+
+class SemanticLRUCache:
+    """
+    Bounded semantic cache with least-recently-used eviction.
+
+    Embeddings are kept in one preallocated (capacity, dim) float32 matrix
+    so the nearest-neighbor lookup is a single matrix-vector product
+    instead of a Python loop over entries.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        max_distance: float = 0.15,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+    ):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = Lock()
+        self._embeddings: Optional[np.ndarray] = None  # (capacity, dim) float32
+        self._ks: Optional[np.ndarray] = None          # k of each stored entry
+        self._last_used: Optional[np.ndarray] = None   # LRU clock per entry
+        self._values: list = []
+        self._size = 0
+        self._clock = 0
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        """Encode a prompt to a unit-norm float32 vector, via the embedding cache."""
+        emb = embedding_cache.get(self.model_name, prompt)
+        if emb is None:
+            # Shared process-wide model — no second copy of the weights
+            emb = get_model(self.model_name).encode(
+                prompt, convert_to_numpy=True
+            ).astype("float32")
+            embedding_cache.put(self.model_name, prompt, emb)
+        norm = np.linalg.norm(emb)
+        if norm > 0:
+            emb = emb / norm
+        return emb
+
+    def _ensure_storage(self, dim: int) -> None:
+        if self._embeddings is None:
+            self._embeddings = np.zeros((self.capacity, dim), dtype="float32")
+            self._ks = np.zeros(self.capacity, dtype="int32")
+            self._last_used = np.zeros(self.capacity, dtype="int64")
+            self._values = [None] * self.capacity
+
+    async def get(self, prompt: str, k: int) -> Optional[Any]:
+        """
+        Return the cached response of the semantically nearest prior prompt
+        with the same k, or None if nothing is within max_distance.
+
+        The encode (on a cache miss in the embedding cache) runs in a
+        worker thread so the event loop is never blocked by a forward pass.
+        """
+        query = await asyncio.to_thread(self._embed, prompt)
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                return None
+
+            # One matvec against all stored keys; mask out entries whose k differs
+            sims = self._embeddings[:self._size] @ query
+            sims[self._ks[:self._size] != k] = -np.inf
+            best = int(np.argmax(sims))
+            if 1.0 - sims[best] > self.max_distance:
+                self.misses += 1
+                return None
+
+            # Move-to-front in LRU terms: bump the entry's clock
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            return self._values[best]
+
+    async def put(self, prompt: str, k: int, value: Any) -> None:
+        """Insert a response, evicting the least-recently-used entry if full."""
+        emb = await asyncio.to_thread(self._embed, prompt)
+        with self._lock:
+            self._ensure_storage(emb.shape[0])
+
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used[:self._size]))
+
+            self._clock += 1
+            self._embeddings[row] = emb
+            self._ks[row] = k
+            self._last_used[row] = self._clock
+            self._values[row] = value
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            return {
+                "size": self._size,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+            }